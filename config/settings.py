@@ -6,6 +6,17 @@ load_dotenv()
 
 class Settings:
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
+    # 是否透過 gradio.live 建立公開分享連結；預設關閉以省去額外的通道轉送
+    GRADIO_SHARE: bool = os.getenv("GRADIO_SHARE", "0") == "1"
+    # 帳號每分鐘可用的 token 上限（TPM）；0 表示不在本地限制，交由 OpenAI 端控管
+    OPENAI_TOKENS_PER_MINUTE: int = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "0") or 0)
+    # 整個程序同時進行中的 OpenAI 請求上限，依帳號等級調整
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8") or 8)
+
+    def reload(self) -> None:
+        """重新讀取 .env，讓執行中的程序也能取得之後才設定的 API 金鑰"""
+        load_dotenv()
+        self.OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 settings = Settings()
 
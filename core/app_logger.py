@@ -0,0 +1,29 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+LOGGER_NAME = "pokemon_novel"
+
+
+def _setup_logger() -> logging.Logger:
+    """
+    建立共用 logger：記錄先放進佇列，由背景執行緒寫到 stderr，
+    事件迴圈上的處理函數不會因為輸出 I/O 而被卡住
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    # 結束前把佇列中剩下的記錄寫完
+    atexit.register(listener.stop)
+
+    app_logger = logging.getLogger(LOGGER_NAME)
+    app_logger.setLevel(logging.INFO)
+    app_logger.addHandler(QueueHandler(log_queue))
+    app_logger.propagate = False
+    return app_logger
+
+
+logger = _setup_logger()
@@ -0,0 +1,75 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+import asyncio
+
+T = TypeVar("T")
+
+
+class _SharedStream:
+    """一個進行中的串流：只保留最新的一筆結果，讓後加入的呼叫者直接從目前進度開始"""
+
+    def __init__(self) -> None:
+        self.latest: Any = None
+        self.version = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class Coalescer:
+    """
+    Single-flight：相同鍵的並行請求共用同一次執行，結果（或例外）分給所有等待者
+    執行完成後就移除，之後相同鍵的請求會重新執行
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # 單一呼叫者取消時不影響其他仍在等待的呼叫者
+        return await asyncio.shield(future)
+
+    async def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        共用同一個串流；適用於每筆都回傳「目前累積結果」的串流，
+        較慢的呼叫者可能略過中間幾筆，但一定會收到最後一筆
+        """
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = _SharedStream()
+            self._streams[key] = shared
+            shared.task = asyncio.ensure_future(self._pump(key, shared, factory))
+
+        seen = 0
+        while True:
+            async with shared.changed:
+                await shared.changed.wait_for(lambda: shared.version > seen or shared.done)
+                latest, version, done, error = shared.latest, shared.version, shared.done, shared.error
+            if version > seen:
+                seen = version
+                yield latest
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+    async def _pump(self, key: Hashable, shared: _SharedStream, factory: Callable[[], AsyncIterator[T]]) -> None:
+        try:
+            async for item in factory():
+                async with shared.changed:
+                    shared.latest = item
+                    shared.version += 1
+                    shared.changed.notify_all()
+        except Exception as e:
+            shared.error = e
+        finally:
+            self._streams.pop(key, None)
+            async with shared.changed:
+                shared.done = True
+                shared.changed.notify_all()
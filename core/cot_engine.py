@@ -1,13 +1,28 @@
-from typing import Dict, Any, Optional, Tuple, TypedDict
+from typing import Dict, Any, Optional, Tuple, TypedDict, AsyncIterator
 import asyncio
+import json
 
+from core.app_logger import logger
 from core.llm_services import LLMService, OpenAIConfigError
 from core import prompt_templates
 from core.pokemon_knowledge_base import format_pokemon_names_for_prompt
+from core.prompt_templates import precompute_prompt_context, derive_suggestion_context
 
 class StoryGenerationError(Exception):
     pass
 
+# 串流產生時回報目前所處的階段：初稿串流中、審閱修訂中、最終結果
+STAGE_DRAFT = "draft"
+STAGE_REVIEW = "review"
+STAGE_FINAL = "final"
+
+# 一次產生大綱與故事時，模型輸出中分隔兩個部分的標題
+FUSED_PLAN_MARKER = "## 故事計劃"
+FUSED_STORY_MARKER = "## 完整故事"
+
+# 一次取得的大綱增強分析：JSON 回應中的鍵
+PLAN_ENRICHMENT_KEYS = ("elaborations", "character_profiles", "setting_details", "plot_twists")
+
 class ReviewerOutput(TypedDict):
     feedback: str
     revised_content: str
@@ -77,21 +92,22 @@ def _parse_reviewer_output(raw_output: str, original_content_if_no_revision: str
             # 如果輸出為空，使用原始內容
             return ReviewerOutput(feedback="空回應", revised_content=original_content_if_no_revision)
 
+def _split_plan_and_story(raw_output: str) -> Tuple[str, str]:
+    """
+    將合併輸出拆成 (故事大綱, 完整故事)；故事標題尚未出現時，完整故事為空字串
+    """
+    story_plan, _, full_story = raw_output.partition(FUSED_STORY_MARKER)
+    story_plan = story_plan.replace(FUSED_PLAN_MARKER, "", 1)
+    return story_plan.strip(), full_story.strip()
+
 class CoTEngine:
 
     def __init__(self, llm_service: LLMService) -> None:
         self.llm_service = llm_service
 
-    async def _generate_story_plan_initial(self, theme: str, genre: str, pokemon_names: str, synopsis: str, include_abilities: bool) -> str:
+    async def _generate_story_plan_initial(self, prompt_context: Dict[str, str]) -> str:
         try:
-            formatted_pokemon_names = format_pokemon_names_for_prompt(pokemon_names)
-            plan_prompt = prompt_templates.STORY_PLANNING_PROMPT_TEMPLATE.format(
-                theme=theme,
-                genre=genre,
-                pokemon_names=formatted_pokemon_names,
-                synopsis=synopsis,
-                include_abilities="是" if include_abilities else "否"
-            )
+            plan_prompt = prompt_templates.STORY_PLANNING_PROMPT_TEMPLATE.format(**prompt_context)
             story_plan = await self.llm_service.generate_text(plan_prompt, max_tokens=1536)
             if not story_plan or story_plan.strip() == "":
                 raise StoryGenerationError("LLM 無法產生初始故事大綱。回應為空。")
@@ -103,23 +119,35 @@ class CoTEngine:
         except Exception as e:
             raise StoryGenerationError(f"初始故事大綱產生時發生意外錯誤：{e}") from e
 
+    async def _stream_story_plan_initial(self, prompt_context: Dict[str, str]) -> AsyncIterator[str]:
+        try:
+            plan_prompt = prompt_templates.STORY_PLANNING_PROMPT_TEMPLATE.format(**prompt_context)
+            story_plan = ""
+            async for delta in self.llm_service.generate_text_stream(plan_prompt, max_tokens=1536):
+                story_plan += delta
+                yield story_plan
+            if not story_plan or story_plan.strip() == "":
+                raise StoryGenerationError("LLM 無法產生初始故事大綱。回應為空。")
+        except OpenAIConfigError as e:
+            raise StoryGenerationError(f"初始大綱產生時發生 LLM 設定錯誤：{e}") from e
+        except KeyError as e:
+            raise StoryGenerationError(f"初始大綱產生時發生提示格式錯誤：{e}") from e
+        except Exception as e:
+            raise StoryGenerationError(f"初始故事大綱產生時發生意外錯誤：{e}") from e
+
     async def _review_and_revise_story_plan(
-        self, theme: str, genre: str, pokemon_names: str, synopsis: str, 
-        include_abilities: bool, story_plan_to_review: str
+        self, prompt_context: Dict[str, str], story_plan_to_review: str
     ) -> ReviewerOutput:
         try:
-            formatted_pokemon_names_for_review = format_pokemon_names_for_prompt(pokemon_names)
             review_prompt = prompt_templates.STORY_PLAN_REVIEW_REVISE_PROMPT_TEMPLATE.format(
-                theme=theme, genre=genre, pokemon_names=formatted_pokemon_names_for_review,
-                synopsis=synopsis, include_abilities="是" if include_abilities else "否",
-                story_plan_to_review=story_plan_to_review
+                **prompt_context, story_plan_to_review=story_plan_to_review
             )
             raw_reviewer_output = await self.llm_service.generate_text(review_prompt, max_tokens=2048)
             if not raw_reviewer_output or raw_reviewer_output.strip() == "":
                  raise StoryGenerationError("審閱者 LLM 無法提供故事大綱的回饋/修訂。")
             
             parsed_output = _parse_reviewer_output(raw_reviewer_output, story_plan_to_review)
-            print(f"大綱審閱回饋：{parsed_output['feedback']}")
+            logger.info(f"大綱審閱回饋：{parsed_output['feedback']}")
             return parsed_output
         except OpenAIConfigError as e:
             raise StoryGenerationError(f"大綱審閱時發生 LLM 設定錯誤：{e}") from e
@@ -128,26 +156,43 @@ class CoTEngine:
         except Exception as e:
             raise StoryGenerationError(f"故事大綱審閱時發生意外錯誤：{e}") from e
 
-    async def generate_story_plan(self, theme: str, genre: str, pokemon_names: str, synopsis: str, include_abilities: bool) -> str:
-        print(f"正在產生初始故事大綱：主題='{theme}', 類型='{genre}', 能力='{include_abilities}'")
-        initial_plan = await self._generate_story_plan_initial(theme, genre, pokemon_names, synopsis, include_abilities)
+    async def generate_story_plan(
+        self, theme: str, genre: str, pokemon_names: str, synopsis: str, include_abilities: bool,
+        prompt_context: Optional[Dict[str, str]] = None
+    ) -> str:
+        logger.info(f"正在產生初始故事大綱：主題='{theme}', 類型='{genre}', 能力='{include_abilities}'")
+        if prompt_context is None:
+            prompt_context = precompute_prompt_context(theme, genre, pokemon_names, synopsis, include_abilities)
+        initial_plan = await self._generate_story_plan_initial(prompt_context)
 
-        print("正在審閱和修訂故事大綱...")
-        reviewer_result = await self._review_and_revise_story_plan(
-            theme, genre, pokemon_names, synopsis, include_abilities, initial_plan
-        )
+        logger.info("正在審閱和修訂故事大綱...")
+        reviewer_result = await self._review_and_revise_story_plan(prompt_context, initial_plan)
         return reviewer_result['revised_content']
 
-    async def _generate_story_from_plan_initial(
-        self, theme: str, genre: str, pokemon_names: str, synopsis: str, 
-        story_plan: str, include_abilities: bool
-    ) -> str:
+    async def generate_story_plan_stream(
+        self, theme: str, genre: str, pokemon_names: str, synopsis: str, include_abilities: bool,
+        prompt_context: Optional[Dict[str, str]] = None
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        串流產生故事大綱，逐步回傳 (階段, 目前內容)：
+        初稿逐段累積時為 STAGE_DRAFT，開始審閱時為 STAGE_REVIEW，修訂完成為 STAGE_FINAL
+        """
+        logger.info(f"正在串流產生初始故事大綱：主題='{theme}', 類型='{genre}', 能力='{include_abilities}'")
+        if prompt_context is None:
+            prompt_context = precompute_prompt_context(theme, genre, pokemon_names, synopsis, include_abilities)
+        initial_plan = ""
+        async for initial_plan in self._stream_story_plan_initial(prompt_context):
+            yield STAGE_DRAFT, initial_plan
+
+        logger.info("正在審閱和修訂故事大綱...")
+        yield STAGE_REVIEW, initial_plan
+        reviewer_result = await self._review_and_revise_story_plan(prompt_context, initial_plan)
+        yield STAGE_FINAL, reviewer_result['revised_content']
+
+    async def _generate_story_from_plan_initial(self, prompt_context: Dict[str, str], story_plan: str) -> str:
         try:
-            formatted_pokemon_names = format_pokemon_names_for_prompt(pokemon_names)
             story_prompt = prompt_templates.STORY_GENERATION_FROM_PLAN_PROMPT_TEMPLATE.format(
-                story_plan=story_plan, theme=theme, genre=genre, 
-                pokemon_names=formatted_pokemon_names, synopsis=synopsis,
-                include_abilities="是" if include_abilities else "否"
+                **prompt_context, story_plan=story_plan
             )
             full_story = await self.llm_service.generate_text(story_prompt, max_tokens=4096, temperature=0.75)
             if not full_story or full_story.strip() == "":
@@ -160,15 +205,32 @@ class CoTEngine:
         except Exception as e:
             raise StoryGenerationError(f"初始完整故事生成期間發生意外錯誤：{e}") from e
 
+    async def _stream_story_from_plan_initial(
+        self, prompt_context: Dict[str, str], story_plan: str
+    ) -> AsyncIterator[str]:
+        try:
+            story_prompt = prompt_templates.STORY_GENERATION_FROM_PLAN_PROMPT_TEMPLATE.format(
+                **prompt_context, story_plan=story_plan
+            )
+            full_story = ""
+            async for delta in self.llm_service.generate_text_stream(story_prompt, max_tokens=4096, temperature=0.75):
+                full_story += delta
+                yield full_story
+            if not full_story or full_story.strip() == "":
+                raise StoryGenerationError("LLM 未能生成初始完整故事。回應為空。")
+        except OpenAIConfigError as e:
+            raise StoryGenerationError(f"初始故事生成期間發生 LLM 配置錯誤：{e}") from e
+        except KeyError as e:
+            raise StoryGenerationError(f"初始故事生成期間發生提詞格式錯誤：{e}") from e
+        except Exception as e:
+            raise StoryGenerationError(f"初始完整故事生成期間發生意外錯誤：{e}") from e
+
     async def _review_and_revise_full_story(
-        self, theme: str, genre: str, pokemon_names: str, synopsis: str, 
-        include_abilities: bool, story_plan: str, full_story_to_review: str
+        self, prompt_context: Dict[str, str], story_plan: str, full_story_to_review: str
     ) -> ReviewerOutput:
         try:
-            formatted_pokemon_names_for_review = format_pokemon_names_for_prompt(pokemon_names)
             review_prompt = prompt_templates.FULL_STORY_REVIEW_REVISE_PROMPT_TEMPLATE.format(
-                theme=theme, genre=genre, pokemon_names=formatted_pokemon_names_for_review,
-                synopsis=synopsis, include_abilities="是" if include_abilities else "否",
+                **prompt_context,
                 story_plan=story_plan,
                 full_story_to_review=full_story_to_review
             )
@@ -177,7 +239,7 @@ class CoTEngine:
                  raise StoryGenerationError("評論者 LLM 未能為完整故事提供回饋/修訂。")
             
             parsed_output = _parse_reviewer_output(raw_reviewer_output, full_story_to_review)
-            print(f"完整故事評論回饋：{parsed_output['feedback']}")
+            logger.info(f"完整故事評論回饋：{parsed_output['feedback']}")
             return parsed_output
         except OpenAIConfigError as e:
             raise StoryGenerationError(f"完整故事評論期間發生 LLM 配置錯誤：{e}") from e
@@ -188,19 +250,67 @@ class CoTEngine:
 
     async def generate_story_from_plan(
         self, theme: str, genre: str, pokemon_names: str, synopsis: str, 
-        story_plan: str, include_abilities: bool
+        story_plan: str, include_abilities: bool,
+        prompt_context: Optional[Dict[str, str]] = None
     ) -> str:
-        print(f"根據計畫生成初始完整故事：主題='{theme}', 類型='{genre}', 能力='{include_abilities}'")
-        initial_story = await self._generate_story_from_plan_initial(
-            theme, genre, pokemon_names, synopsis, story_plan, include_abilities
-        )
+        logger.info(f"根據計畫生成初始完整故事：主題='{theme}', 類型='{genre}', 能力='{include_abilities}'")
+        if prompt_context is None:
+            prompt_context = precompute_prompt_context(theme, genre, pokemon_names, synopsis, include_abilities)
+        initial_story = await self._generate_story_from_plan_initial(prompt_context, story_plan)
         
-        print("正在評論並修訂完整故事...")
-        reviewer_result = await self._review_and_revise_full_story(
-            theme, genre, pokemon_names, synopsis, include_abilities, story_plan, initial_story
-        )
+        logger.info("正在評論並修訂完整故事...")
+        reviewer_result = await self._review_and_revise_full_story(prompt_context, story_plan, initial_story)
         return reviewer_result['revised_content']
 
+    async def generate_story_from_plan_stream(
+        self, theme: str, genre: str, pokemon_names: str, synopsis: str, 
+        story_plan: str, include_abilities: bool,
+        prompt_context: Optional[Dict[str, str]] = None
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        串流產生完整故事，回傳格式與 generate_story_plan_stream 相同
+        """
+        logger.info(f"根據計畫串流生成初始完整故事：主題='{theme}', 類型='{genre}', 能力='{include_abilities}'")
+        if prompt_context is None:
+            prompt_context = precompute_prompt_context(theme, genre, pokemon_names, synopsis, include_abilities)
+        initial_story = ""
+        async for initial_story in self._stream_story_from_plan_initial(prompt_context, story_plan):
+            yield STAGE_DRAFT, initial_story
+
+        logger.info("正在評論並修訂完整故事...")
+        yield STAGE_REVIEW, initial_story
+        reviewer_result = await self._review_and_revise_full_story(prompt_context, story_plan, initial_story)
+        yield STAGE_FINAL, reviewer_result['revised_content']
+
+    async def generate_plan_and_story_stream(
+        self, theme: str, genre: str, pokemon_names: str, synopsis: str,
+        include_abilities: bool,
+        prompt_context: Optional[Dict[str, str]] = None
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        以單一請求接連產生故事大綱與完整故事（不經過審閱修訂），逐步回傳 (故事大綱, 完整故事)
+        """
+        logger.info(f"串流一次產生故事大綱與完整故事：主題='{theme}', 類型='{genre}', 能力='{include_abilities}'")
+        if prompt_context is None:
+            prompt_context = precompute_prompt_context(theme, genre, pokemon_names, synopsis, include_abilities)
+        try:
+            fused_prompt = prompt_templates.PLAN_AND_STORY_PROMPT_TEMPLATE.format(
+                **prompt_context, plan_marker=FUSED_PLAN_MARKER, story_marker=FUSED_STORY_MARKER
+            )
+            raw_output = ""
+            async for delta in self.llm_service.generate_text_stream(fused_prompt, max_tokens=5632, temperature=0.75):
+                raw_output += delta
+                yield _split_plan_and_story(raw_output)
+            story_plan, full_story = _split_plan_and_story(raw_output)
+            if not story_plan or not full_story:
+                raise StoryGenerationError("LLM 未能在同一回應中產生故事大綱與完整故事。")
+        except OpenAIConfigError as e:
+            raise StoryGenerationError(f"一次產生大綱與故事時發生 LLM 設定錯誤：{e}") from e
+        except KeyError as e:
+            raise StoryGenerationError(f"一次產生大綱與故事時發生提示格式錯誤：{e}") from e
+        except Exception as e:
+            raise StoryGenerationError(f"一次產生大綱與故事時發生意外錯誤：{e}") from e
+
     async def generate_complete_story(
         self, 
         theme: str, 
@@ -209,11 +319,12 @@ class CoTEngine:
         synopsis: str,
         include_abilities: bool
     ) -> Tuple[str, str]:
-        print(f"開始故事生成：主題：'{theme}', 類型：'{genre}', 包含能力：{include_abilities}")
-        story_plan = await self._generate_story_plan_initial(theme, genre, pokemon_names, synopsis, include_abilities)
-        print("故事計畫已生成。現在生成完整故事...")
-        full_story = await self._generate_story_from_plan_initial(theme, genre, pokemon_names, synopsis, story_plan, include_abilities)
-        print("完整故事生成成功。")
+        logger.info(f"開始故事生成：主題：'{theme}', 類型：'{genre}', 包含能力：{include_abilities}")
+        prompt_context = precompute_prompt_context(theme, genre, pokemon_names, synopsis, include_abilities)
+        story_plan = await self._generate_story_plan_initial(prompt_context)
+        logger.info("故事計畫已生成。現在生成完整故事...")
+        full_story = await self._generate_story_from_plan_initial(prompt_context, story_plan)
+        logger.info("完整故事生成成功。")
         return story_plan, full_story
 
     async def get_input_refinement_suggestions(
@@ -229,11 +340,7 @@ class CoTEngine:
         pokemon_names_context = pokemon_names if pokemon_names else "未指定"
         synopsis_context = synopsis if synopsis else "未指定"
 
-        pokemon_suggestion_context_val = "寶可夢"
-        if pokemon_names:
-            first_pokemon = pokemon_names.split(',')[0].strip()
-            if first_pokemon:
-                pokemon_suggestion_context_val = first_pokemon
+        pokemon_suggestion_context_val = derive_suggestion_context(pokemon_names)
         
         try:
             suggestion_prompt = prompt_templates.INPUT_REFINEMENT_SUGGESTION_PROMPT_TEMPLATE.format(
@@ -255,15 +362,62 @@ class CoTEngine:
         except Exception as e:
             raise StoryGenerationError(f"建議生成期間發生意外錯誤：{e}") from e
 
+    async def get_plan_enrichments(
+        self,
+        theme: str,
+        genre: str,
+        pokemon_names: str,
+        synopsis: str,
+        story_plan: str,
+        prompt_context: Optional[Dict[str, str]] = None
+    ) -> Dict[str, str]:
+        """
+        以單一請求取得故事大綱闡述、角色檔案、場景細節與劇情轉折，回傳以 PLAN_ENRICHMENT_KEYS 為鍵的字典
+        """
+        try:
+            formatted_pokemon_names = (
+                prompt_context["pokemon_names"] if prompt_context
+                else format_pokemon_names_for_prompt(pokemon_names)
+            )
+            prompt = prompt_templates.PLAN_ENRICHMENTS_PROMPT_TEMPLATE.format(
+                theme=theme,
+                genre=genre,
+                pokemon_names=formatted_pokemon_names,
+                synopsis=synopsis,
+                story_plan=story_plan
+            )
+            raw_output = await self.llm_service.generate_text(
+                prompt, max_tokens=4096, temperature=0.7, response_format={"type": "json_object"}
+            )
+            parsed = json.loads(raw_output)
+            if not isinstance(parsed, dict):
+                raise StoryGenerationError("LLM 回傳的大綱增強分析不是 JSON 物件。")
+            enrichments = {key: str(parsed.get(key) or "") for key in PLAN_ENRICHMENT_KEYS}
+            if not any(value.strip() for value in enrichments.values()):
+                raise StoryGenerationError("LLM 未能生成大綱增強分析。")
+            return enrichments
+        except OpenAIConfigError as e:
+            raise StoryGenerationError(f"大綱增強分析期間發生 LLM 配置錯誤：{e}") from e
+        except KeyError as e:
+            raise StoryGenerationError(f"大綱增強分析期間發生提詞格式錯誤：{e}") from e
+        except ValueError as e:
+            raise StoryGenerationError(f"大綱增強分析的回應無法解析為 JSON：{e}") from e
+        except Exception as e:
+            raise StoryGenerationError(f"大綱增強分析期間發生意外錯誤：{e}") from e
+
     async def get_synopsis_elaborations(
         self,
         theme: str,
         genre: str,
         pokemon_names: str,
-        synopsis: str
+        synopsis: str,
+        prompt_context: Optional[Dict[str, str]] = None
     ) -> str:
         try:
-            formatted_pokemon_names = format_pokemon_names_for_prompt(pokemon_names)
+            formatted_pokemon_names = (
+                prompt_context["pokemon_names"] if prompt_context
+                else format_pokemon_names_for_prompt(pokemon_names)
+            )
             prompt = prompt_templates.SYNOPSIS_ELABORATION_PROMPT_TEMPLATE.format(
                 theme=theme,
                 genre=genre,
@@ -287,10 +441,14 @@ class CoTEngine:
         genre: str,
         pokemon_names: str,
         synopsis: str,
-        story_plan: Optional[str] = None
+        story_plan: Optional[str] = None,
+        prompt_context: Optional[Dict[str, str]] = None
     ) -> str:
         try:
-            formatted_pokemon_names = format_pokemon_names_for_prompt(pokemon_names)
+            formatted_pokemon_names = (
+                prompt_context["pokemon_names"] if prompt_context
+                else format_pokemon_names_for_prompt(pokemon_names)
+            )
             # 使用基本模板，因為沒有專門的角色模板
             prompt = f"""<s>[INST] 您是一位寶可夢故事分析專家。根據以下資訊，請為故事中的主要角色（寶可夢和人類）建立詳細的角色檔案。
 
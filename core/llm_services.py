@@ -1,12 +1,63 @@
-from openai import OpenAI
-from typing import Optional, Dict, Any, AsyncIterator
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from typing import Optional, Dict, Any, AsyncIterator, Tuple
 import asyncio
+import importlib.util
+import time
+import weakref
+import httpx
 
 from config.settings import settings
+from core.app_logger import logger
 
 class OpenAIConfigError(Exception):
     pass
 
+# 所有並行請求共用同一個連線池，讓 keep-alive 連線可以重複使用
+HTTP_CONNECTION_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+# 讀取逾時是兩次收到資料之間的間隔，長篇非串流回應也需要足夠時間；連線逾時則應快速失敗
+HTTP_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+# SDK 內建重試：只針對 429、408/409、5xx、連線錯誤與逾時，以指數退避加隨機抖動等待並遵守 Retry-After；
+# 驗證或參數錯誤不會重試。多給幾次機會，避免一次暫時性錯誤就讓使用者整段重新產生
+OPENAI_MAX_RETRIES = 4
+# 有安裝 h2 套件時改用 HTTP/2，並行請求可以在同一條連線上多工傳輸；未安裝時維持 HTTP/1.1
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+# 整個程序同時進行中的 OpenAI 請求上限，超過時排隊等待，避免突發流量觸發速率限制
+# 可用 LLM_MAX_CONCURRENCY 環境變數調整
+MAX_CONCURRENT_REQUESTS = max(1, settings.LLM_MAX_CONCURRENCY)
+
+class TokenBudget:
+    """
+    每分鐘 token 額度（token bucket）：額度依時間平均補充，不足時等待補充後再送出請求
+    避免突發流量超過帳號的 TPM 上限而收到 429
+    """
+
+    def __init__(self, tokens_per_minute: int) -> None:
+        self.capacity = float(tokens_per_minute)
+        self.refill_per_second = tokens_per_minute / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, n_tokens: int) -> None:
+        # 單次請求超過整個額度時最多等到額度全滿，避免永遠等不到
+        n_tokens = min(float(n_tokens), self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.refill_per_second)
+                self.updated = now
+                if self.available >= n_tokens:
+                    self.available -= n_tokens
+                    return
+                await asyncio.sleep((n_tokens - self.available) / self.refill_per_second)
+
+def estimate_request_tokens(prompt: str, max_tokens: int) -> int:
+    """
+    粗估一次請求佔用的 token 數：提示以每個字元一個 token 計算，再加上回應上限
+    本專案的提示以繁體中文為主，中文約每字一個 token 以上；英文會因此高估，寧可多等也不觸發 429
+    """
+    return len(prompt) + max_tokens
+
 class LLMService:
     def __init__(self, api_key: Optional[str] = None, model_name: str = "gpt-4.1") -> None:
         resolved_api_key = api_key if api_key is not None else settings.OPENAI_API_KEY
@@ -15,8 +66,49 @@ class LLMService:
                 "找不到 OpenAI API key。請在 .env 檔案中設定 OPENAI_API_KEY 或直接傳入參數。"
             )
         
-        self.client = OpenAI(api_key=resolved_api_key)
+        self._api_key = resolved_api_key
         self.model_name = model_name
+        # httpx 連線池與 Semaphore 都綁定建立它們的事件迴圈，因此每個事件迴圈各自共用一組
+        self._sessions: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _session(self) -> Tuple[AsyncOpenAI, asyncio.Semaphore, Optional[TokenBudget]]:
+        """取得目前事件迴圈共用的 client、請求名額與 token 額度，第一次使用時建立"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None:
+            client = AsyncOpenAI(
+                api_key=self._api_key,
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=HTTP_CONNECTION_LIMITS, timeout=HTTP_TIMEOUT, http2=HTTP2_ENABLED
+                ),
+            )
+            tokens_per_minute = settings.OPENAI_TOKENS_PER_MINUTE
+            token_budget = TokenBudget(tokens_per_minute) if tokens_per_minute > 0 else None
+            session = (client, asyncio.Semaphore(MAX_CONCURRENT_REQUESTS), token_budget)
+            self._sessions[loop] = session
+        return session
+
+    async def aclose(self) -> None:
+        """關閉目前事件迴圈的 HTTP 連線池"""
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session[0].close()
+
+    def close_all(self) -> None:
+        """同步關閉所有事件迴圈上的 HTTP 連線池，供程式結束時呼叫"""
+        for loop, (client, _, _) in list(self._sessions.items()):
+            if loop.is_closed():
+                continue
+            try:
+                if loop.is_running():
+                    # 事件迴圈在其他執行緒（例如 Gradio 伺服器）上執行
+                    asyncio.run_coroutine_threadsafe(client.close(), loop).result(timeout=5)
+                else:
+                    loop.run_until_complete(client.close())
+            except Exception as e:
+                logger.warning(f"關閉 OpenAI 連線池時發生錯誤: {e}")
+        self._sessions.clear()
 
     async def generate_text(
         self,
@@ -27,29 +119,59 @@ class LLMService:
         **kwargs: Any
     ) -> str:
         if stream:
-            pass
+            chunks = [
+                delta async for delta in self.generate_text_stream(
+                    prompt, max_tokens=max_tokens, temperature=temperature, **kwargs
+                )
+            ]
+            return "".join(chunks)
 
         try:
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                stream=stream,
-                **kwargs
-            )
+            client, request_slots, token_budget = self._session()
+            if token_budget is not None:
+                await token_budget.acquire(estimate_request_tokens(prompt, max_tokens))
+            async with request_slots:
+                response = await client.chat.completions.create(
+                    model=self.model_name,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    **kwargs
+                )
+            return response.choices[0].message.content or ""
+        except Exception as e:
+            logger.error(f"OpenAI API 呼叫錯誤: {e}")
+            raise OpenAIConfigError(f"OpenAI API 呼叫失敗: {e}")
 
-            if stream:
-                full_response_content = ""
-                print("警告：串流功能尚未完全實作。如果可用，將返回完整回應，否則返回空值。")
-                if hasattr(response, 'choices') and response.choices:
-                     return response.choices[0].message.content or ""
-                return "[串流回應未完全處理]"
-            else:
-                return response.choices[0].message.content or ""
+    async def generate_text_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        **kwargs: Any
+    ) -> AsyncIterator[str]:
+        """逐段回傳模型產生的文字片段（delta）"""
+        try:
+            # 串流期間持續佔用一個名額，直到回應讀取完畢
+            client, request_slots, token_budget = self._session()
+            if token_budget is not None:
+                await token_budget.acquire(estimate_request_tokens(prompt, max_tokens))
+            async with request_slots:
+                response = await client.chat.completions.create(
+                    model=self.model_name,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=True,
+                    **kwargs
+                )
+                async for chunk in response:
+                    if chunk.choices:
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            yield delta
         except Exception as e:
-            print(f"OpenAI API 呼叫錯誤: {e}")
+            logger.error(f"OpenAI API 呼叫錯誤: {e}")
             raise OpenAIConfigError(f"OpenAI API 呼叫失敗: {e}")
 
 async def main_test() -> None:
@@ -64,7 +186,8 @@ async def main_test() -> None:
         print(f"生成的文字(非串流):\n{generated_text_non_stream}")
 
         generated_text_stream = await llm_service.generate_text(prompt_text, max_tokens=50, stream=True)
-        print(f"生成的文字(模擬串流呼叫):\n{generated_text_stream}")
+        print(f"生成的文字(串流):\n{generated_text_stream}")
+        await llm_service.aclose()
 
     except OpenAIConfigError as e:
         print(f"設定錯誤: {e}")
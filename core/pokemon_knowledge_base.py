@@ -1,35 +1,102 @@
+import logging
 import os
-import pandas as pd
-from typing import Optional, Dict, List
+from dataclasses import dataclass
+from typing import Any, Optional, Dict, List
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
 POKEMON_CSV_PATH = os.path.join(DATA_DIR, 'pokemon_data.csv')
 
-try:
-    _df = pd.read_csv(POKEMON_CSV_PATH, encoding='utf-8')
-except Exception as e:
-    print(f"[寶可夢知識庫] 載入失敗: {e}")
-    _df = pd.DataFrame(columns=["id", "zh_name", "en_name", "ja_name"])
+POKEMON_COLUMNS = ["id", "zh_name", "en_name", "ja_name"]
 
-_pokemon_dict = {row['zh_name']: row.to_dict() for _, row in _df.iterrows()}
+# 與 core.app_logger 同名的 logger；此模組不依賴其他 core 模組，可單獨執行
+logger = logging.getLogger("pokemon_novel")
 
+# 全形逗號、頓號、分號、換行與全形空白等分隔符號一次轉成半形逗號
+_NORM_TABLE = str.maketrans({
+    '，': ',', '、': ',', '；': ',', ';': ',',
+    '\n': ',', '\r': ',', '\t': ',', '　': ',',
+})
 
-def get_pokemon_details_by_zh_name(zh_name: str) -> Optional[Dict[str, str]]:
-    return _pokemon_dict.get(zh_name)
+
+@dataclass(frozen=True, slots=True)
+class PokemonRecord:
+    id: Any
+    zh_name: str
+    en_name: str
+    ja_name: str
+
+    def __getitem__(self, key: str) -> Any:
+        """相容舊有 details['en_name'] 寫法"""
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+
+# 首次查詢時才載入 CSV，避免在 import 時就付出讀檔成本
+# 資料以欄為單位存放（struct-of-arrays），_name_index 將中文名稱對應到列索引
+_name_index: Optional[Dict[str, int]] = None
+_ids: List[Any] = []
+_zh_names: List[str] = []
+_en_names: List[str] = []
+_ja_names: List[str] = []
+# 中文名稱 -> 提示用顯示字串，例如 "皮卡丘 (Pikachu)"
+_display_dict: Dict[str, str] = {}
+
+
+def _read_pokemon_columns() -> Dict[str, List[Any]]:
+    """讀取寶可夢 CSV 並只保留需要的欄位；優先使用 pyarrow，未安裝時退回 pandas"""
+    try:
+        import pyarrow.csv as pacsv
+    except ImportError:
+        import pandas as pd
+        df = pd.read_csv(POKEMON_CSV_PATH, encoding='utf-8', usecols=POKEMON_COLUMNS)
+        return {column: df[column].tolist() for column in POKEMON_COLUMNS}
+
+    table = pacsv.read_csv(
+        POKEMON_CSV_PATH,
+        convert_options=pacsv.ConvertOptions(include_columns=POKEMON_COLUMNS),
+    )
+    return {column: table.column(column).to_pylist() for column in POKEMON_COLUMNS}
+
+
+def _ensure_loaded() -> Dict[str, int]:
+    global _name_index, _ids, _zh_names, _en_names, _ja_names, _display_dict
+    if _name_index is None:
+        try:
+            columns = _read_pokemon_columns()
+        except Exception as e:
+            logger.error(f"[寶可夢知識庫] 載入失敗: {e}")
+            columns = {column: [] for column in POKEMON_COLUMNS}
+        _ids = columns["id"]
+        _zh_names = columns["zh_name"]
+        _en_names = columns["en_name"]
+        _ja_names = columns["ja_name"]
+        _display_dict = {
+            zh_name: f"{zh_name} ({en_name})"
+            for zh_name, en_name in zip(_zh_names, _en_names)
+        }
+        _name_index = {zh_name: i for i, zh_name in enumerate(_zh_names)}
+    return _name_index
+
+
+def get_pokemon_details_by_zh_name(zh_name: str) -> Optional[PokemonRecord]:
+    i = _ensure_loaded().get(zh_name)
+    if i is None:
+        return None
+    return PokemonRecord(_ids[i], _zh_names[i], _en_names[i], _ja_names[i])
+
+
+def split_pokemon_names(user_input: str) -> List[str]:
+    """以逗號切分並去除前後空白；只做一次線性掃描，避免使用者貼上大量空白時拖慢整個程序"""
+    return [name for name in (part.strip() for part in user_input.translate(_NORM_TABLE).split(',')) if name]
 
 
 def format_pokemon_names_for_prompt(user_input: str) -> str:
-    names = [name.strip() for name in user_input.split(',') if name.strip()]
-    formatted = []
-    for name in names:
-        details = get_pokemon_details_by_zh_name(name)
-        if details:
-            formatted.append(f"{details['zh_name']} ({details['en_name']})")
-        else:
-            formatted.append(name)
-    return ', '.join(formatted)
+    _ensure_loaded()
+    display = _display_dict
+    return ', '.join(display.get(name, name) for name in split_pokemon_names(user_input))
 
 if __name__ == "__main__":
     print("[測試] 查詢皮卡丘:", get_pokemon_details_by_zh_name("皮卡丘"))
     print("[測試] 格式化: 皮卡丘, 伊布, 超夢 =>", format_pokemon_names_for_prompt("皮卡丘, 伊布, 超夢"))
-    print("[測試] 格式化: 小火龍, 妙蛙種子, 不存在寶可夢 =>", format_pokemon_names_for_prompt("小火龍, 妙蛙種子, 不存在寶可夢"))
\ No newline at end of file
+    print("[測試] 格式化: 小火龍, 妙蛙種子, 不存在寶可夢 =>", format_pokemon_names_for_prompt("小火龍, 妙蛙種子, 不存在寶可夢"))
@@ -0,0 +1,44 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generic, Optional, TypeVar
+import hashlib
+
+T = TypeVar("T")
+
+
+def make_cache_key(*parts: Any) -> bytes:
+    """將輸入參數雜湊成固定長度的快取鍵"""
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).digest()
+
+
+class ResponseCache(Generic[T]):
+    """
+    以輸入雜湊為鍵的 LRU 快取，讓相同輸入的 LLM 請求直接回傳先前結果
+    只會快取成功的結果；例外會照常拋出，下次呼叫會重新請求
+    """
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, T]" = OrderedDict()
+
+    def get(self, key: bytes) -> Optional[T]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: bytes, value: T) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key: bytes, compute: Callable[[], Awaitable[T]]) -> T:
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        value = await compute()
+        self.put(key, value)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,13 @@
+import unittest
+
+from core.llm_services import estimate_request_tokens
+
+
+class EstimateRequestTokensTest(unittest.TestCase):
+    def test_chinese_prompt_counts_each_character(self):
+        prompt = "請根據以下寶可夢與故事概要，撰寫一篇完整的冒險故事。" * 20
+        self.assertGreaterEqual(estimate_request_tokens(prompt, 500), len(prompt) + 500)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,25 @@
+import time
+import unittest
+
+from core.pokemon_knowledge_base import split_pokemon_names
+
+
+class SplitPokemonNamesTest(unittest.TestCase):
+    def test_mixed_separators(self):
+        self.assertEqual(
+            split_pokemon_names(" 皮卡丘，伊布、超夢;\n小火龍 , "),
+            ["皮卡丘", "伊布", "超夢", "小火龍"],
+        )
+
+    def test_full_width_space_separates_names(self):
+        self.assertEqual(split_pokemon_names("皮卡丘　小火龍"), ["皮卡丘", "小火龍"])
+
+    def test_long_whitespace_runs_are_linear(self):
+        started = time.perf_counter()
+        self.assertEqual(split_pokemon_names(" " * 100_000), [])
+        self.assertEqual(split_pokemon_names("皮卡丘" + " " * 100_000 + "x,"), ["皮卡丘" + " " * 100_000 + "x"])
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()